@@ -1,11 +1,19 @@
-from flask import Flask, request, jsonify
+from quart import Quart, request, jsonify
+from quart.json.provider import DefaultJSONProvider
 import asyncio
+import logging
+import os
 import time
-from threading import Thread
-from typing import Dict, Optional
+from uuid import uuid4
+from typing import Callable, Dict, Optional, Tuple
+
+import orjson
 
 # Import BLE modules for GATT-based communication
-from ble_utils import discover_devices, ensure_connected, send_command as ble_send_command, disconnect_device
+from ble_utils import (
+    scan_devices, ensure_connected, send_command as ble_send_command,
+    disconnect_device, device_registry
+)
 from ble_device import BLEDevice
 from notification_handler import get_device_data, get_notification_history
 
@@ -16,49 +24,93 @@ from mesh_models import (
     create_onoff_command, create_level_command, create_sensor_query
 )
 
-app = Flask(__name__)
 
-# Global state for BLE GATT devices (original functionality)
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson - used by jsonify and request.get_json"""
+    
+    option = orjson.OPT_NON_STR_KEYS
+    
+    def dumpb(self, obj) -> bytes:
+        """Serialize obj straight to UTF-8 JSON bytes"""
+        return orjson.dumps(obj, default=self.default, option=self.option)
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return self.dumpb(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumpb(obj), mimetype=self.mimetype)
+
+
+app = Quart(__name__)
+app.json = OrjsonProvider(app)
+
+# Configure logging on import, not under __main__: hypercorn imports app:app
+# and leaves the root logger without handlers, which would silently drop the
+# per-notification lines. A no-op if the server already configured logging.
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+logger = logging.getLogger(__name__)
+
+# Global state for BLE GATT devices (original functionality) - set as the
+# registry that ble_utils.send_command looks devices up in
 ble_devices: Dict[str, BLEDevice] = {}
+device_registry.set(ble_devices)
+
+# Background BLE scans started by /ble/discover, keyed by job id
+scan_jobs: Dict[str, asyncio.Task] = {}
+
+# Seconds a finished scan job waits to be polled before it is dropped
+SCAN_JOB_TTL = 300
+
+# Encoded device list served by /ble/discover/<job_id>; None when stale
+_devices_snapshot: Optional[bytes] = None
 
 # Global state for Bluetooth Mesh network
 mesh_network: Optional[MeshNetwork] = None
 mesh_provisioner: Optional[MeshProvisioner] = None
 
-# Event loop for async operations
-loop = None
-loop_thread = None
+def _env_int(name: str) -> Optional[int]:
+    """Integer from the environment, or None when unset or empty"""
+    value = os.environ.get(name)
+    return int(value) if value else None
+
 
+# Opt-in CPU and SCHED_FIFO priority for the serving event loop (BlueZ/D-Bus
+# callbacks run on it). Off by default: a real-time loop can starve
+# bluetoothd on its core, and threads started later inherit both settings.
+LOOP_CPU = _env_int("LOOP_CPU")
+LOOP_RT_PRIORITY = _env_int("LOOP_RT_PRIORITY")
 
-def start_event_loop():
-    """Start the asyncio event loop in a separate thread"""
-    global loop
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    loop.run_forever()
+# Encoded bodies of polled GET responses: name -> (state key, expiry, body)
+RESPONSE_CACHE_TTL = 0.25  # seconds
+_response_cache: Dict[str, Tuple[tuple, float, bytes]] = {}
 
 
-def run_async(coro):
-    """Run an async coroutine from sync context"""
-    global loop
-    if loop is None:
-        return None
-    future = asyncio.run_coroutine_threadsafe(coro, loop)
-    return future.result(timeout=30)  # 30 second timeout
+async def request_json():
+    """Decode the request body with orjson; an empty body yields {}"""
+    body = await request.get_data()
+    return orjson.loads(body) if body else {}
 
 
-@app.before_first_request
-def initialize():
-    """Initialize the event loop on first request"""
-    global loop_thread
-    if loop_thread is None:
-        loop_thread = Thread(target=start_event_loop, daemon=True)
-        loop_thread.start()
-        time.sleep(0.5)  # Give the loop time to start
+def cached_json(name: str, key: tuple, build: Callable[[], dict]):
+    """
+    Return build() as a JSON response, reusing the encoded body while the
+    state key is unchanged and the TTL has not expired. The TTL bounds the
+    staleness of fields that change without bumping the key (link state).
+    """
+    now = time.monotonic()
+    entry = _response_cache.get(name)
+    if entry is None or entry[0] != key or entry[1] < now:
+        entry = (key, now + RESPONSE_CACHE_TTL, app.json.dumpb(build()))
+        _response_cache[name] = entry
+    return app.response_class(entry[2], mimetype=app.json.mimetype)
 
 
 @app.route('/')
-def home():
+async def home():
     return jsonify({
         "status": "BLE & Mesh API is running",
         "modes": {
@@ -66,7 +118,7 @@ def home():
             "mesh": "Bluetooth Mesh network communication (multi-node)"
         },
         "endpoints": {
-            "ble_gatt": ["/ble/discover", "/ble/send", "/ble/data", "/ble/disconnect"],
+            "ble_gatt": ["/ble/discover", "/ble/discover/<job_id>", "/ble/send", "/ble/data", "/ble/disconnect"],
             "mesh": ["/mesh/scan", "/mesh/provision", "/mesh/send", "/mesh/status", "/mesh/nodes"]
         }
     })
@@ -76,34 +128,91 @@ def home():
 # BLE GATT Endpoints (Original functionality - Nordic UART Service)
 # ============================================================================
 
-@app.route('/ble/discover', methods=['POST'])
-def ble_discover():
-    """Discover BLE devices using GATT"""
-    try:
-        data = request.get_json() or {}
-        prefix = data.get('prefix', 'DART TARGETS')
-        
-        run_async(discover_devices(ble_devices, prefix))
-        
+def invalidate_devices_snapshot():
+    """Mark the encoded device list stale after ble_devices or a link changes"""
+    global _devices_snapshot
+    _devices_snapshot = None
+
+
+def devices_snapshot() -> bytes:
+    """Return the encoded device list, rebuilding it only after a change"""
+    global _devices_snapshot
+    if _devices_snapshot is None:
         devices_info = {
             tid: {"address": dev.address, "connected": dev.connected}
             for tid, dev in ble_devices.items()
         }
-        
-        return jsonify({
+        _devices_snapshot = app.json.dumpb({
             "status": "success",
             "devices": devices_info,
-            "count": len(ble_devices)
+            "count": len(devices_info)
         })
+    return _devices_snapshot
+
+
+def add_device(device: BLEDevice):
+    """Register a BLE device and refresh the device list snapshot"""
+    ble_devices[device.target_id] = device
+    invalidate_devices_snapshot()
+
+
+async def register_scanned_devices(prefix):
+    """Scan for BLE devices and register every match in ble_devices"""
+    for name, address, target_id in await scan_devices(prefix):
+        # Keep existing entries (and their live connections) for known devices
+        known = ble_devices.get(target_id)
+        if known is None or known.address != address:
+            add_device(BLEDevice(target_id, address))
+
+
+@app.route('/ble/discover', methods=['POST'])
+async def ble_discover():
+    """Start a background BLE GATT scan and return its job id"""
+    try:
+        data = await request_json()
+        prefix = data.get('prefix', 'DART TARGETS')
+        
+        job_id = uuid4().hex
+        task = asyncio.create_task(register_scanned_devices(prefix))
+        scan_jobs[job_id] = task
+        # Forget jobs nobody polls so scan_jobs cannot grow without bound
+        task.add_done_callback(
+            lambda _: asyncio.get_running_loop().call_later(
+                SCAN_JOB_TTL, scan_jobs.pop, job_id, None
+            )
+        )
+        
+        return jsonify({"status": "scanning", "job_id": job_id}), 202
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/ble/discover/<job_id>', methods=['GET'])
+async def ble_discover_result(job_id):
+    """Poll a BLE GATT scan started by /ble/discover"""
+    try:
+        task = scan_jobs.get(job_id)
+        if task is None:
+            return jsonify({"error": "Scan job not found"}), 404
+        
+        if not task.done():
+            return jsonify({"status": "scanning", "job_id": job_id})
+        
+        # Finished jobs are reported once, then forgotten
+        del scan_jobs[job_id]
+        if task.exception() is not None:
+            return jsonify({"error": str(task.exception())}), 500
+        
+        return app.response_class(devices_snapshot(), mimetype=app.json.mimetype)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @app.route('/ble/send', methods=['POST'])
-def ble_send():
+async def ble_send():
     """Send command to BLE device via GATT (Nordic UART Service)"""
     try:
-        data = request.get_json()
+        data = await request_json()
         target_id = data.get('target_id')
         command = data.get('command')
         value = data.get('value')
@@ -111,7 +220,11 @@ def ble_send():
         if not target_id or not command:
             return jsonify({"error": "target_id and command required"}), 400
         
-        run_async(ble_send_command(target_id, command, value, ble_devices))
+        try:
+            await ble_send_command(target_id, command, value)
+        finally:
+            # May have (re)connected even if the write itself failed
+            invalidate_devices_snapshot()
         
         return jsonify({
             "status": "success",
@@ -125,7 +238,7 @@ def ble_send():
 
 
 @app.route('/ble/data/<target_id>', methods=['GET'])
-def ble_get_data(target_id):
+async def ble_get_data(target_id):
     """Get latest data from BLE device"""
     try:
         data = get_device_data(target_id, ble_devices)
@@ -133,26 +246,34 @@ def ble_get_data(target_id):
             return jsonify({"error": "Device not found"}), 404
         
         device = ble_devices[target_id]
-        return jsonify({
-            "target_id": target_id,
-            "connected": device.connected,
-            "data": data,
-            "last_voltage": device.last_voltage,
-            "last_notification": device.last_notification
-        })
+        return cached_json(
+            f"ble_data:{target_id}",
+            (id(device), device.notification_seq, device.connected),
+            lambda: {
+                "target_id": target_id,
+                "connected": device.connected,
+                "data": data,
+                "last_voltage": device.last_voltage,
+                "voltages": device.voltage_v[-100:].tolist(),
+                "last_notification": device.last_notification
+            }
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @app.route('/ble/disconnect/<target_id>', methods=['POST'])
-def ble_disconnect(target_id):
+async def ble_disconnect(target_id):
     """Disconnect from BLE device"""
     try:
         if target_id not in ble_devices:
             return jsonify({"error": "Device not found"}), 404
         
         device = ble_devices[target_id]
-        run_async(disconnect_device(device))
+        try:
+            await disconnect_device(device)
+        finally:
+            invalidate_devices_snapshot()
         
         return jsonify({"status": "disconnected", "target_id": target_id})
     except Exception as e:
@@ -163,11 +284,53 @@ def ble_disconnect(target_id):
 # Bluetooth Mesh Endpoints (New functionality)
 # ============================================================================
 
+def parse_mesh_address(value) -> int:
+    """Normalize a mesh address from the API (hex string or int) to an int"""
+    return int(value, 16) if isinstance(value, str) else int(value)
+
+
+def build_mesh_message(message_type, payload):
+    """Create a mesh message from an API request, or None for unknown types"""
+    if message_type == 'onoff':
+        on_off = payload.get('on', True)
+        acknowledged = payload.get('acknowledged', True)
+        return create_onoff_command(on_off, acknowledged)
+    elif message_type == 'level':
+        level = payload.get('level', 0)
+        return create_level_command(level)
+    elif message_type == 'sensor':
+        property_id = payload.get('property_id')
+        return create_sensor_query(property_id)
+    return None
+
+
+@app.before_serving
+async def pin_event_loop():
+    """
+    Pin the event loop thread to LOOP_CPU and/or raise it to SCHED_FIFO
+    priority LOOP_RT_PRIORITY, when configured, so notification handling is
+    not migrated or preempted by other work. Best effort: the priority needs
+    CAP_SYS_NICE and both calls are Linux-only.
+    """
+    if LOOP_CPU is not None:
+        try:
+            os.sched_setaffinity(0, {LOOP_CPU})
+            logger.info("[API] Event loop pinned to CPU %d", LOOP_CPU)
+        except (AttributeError, OSError) as e:
+            logger.warning("[API] Could not pin event loop to CPU %d: %s", LOOP_CPU, e)
+    if LOOP_RT_PRIORITY is not None:
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(LOOP_RT_PRIORITY))
+            logger.info("[API] Event loop running with SCHED_FIFO priority %d", LOOP_RT_PRIORITY)
+        except (AttributeError, OSError) as e:
+            logger.warning("[API] Could not raise event loop priority: %s", e)
+
+
 @app.route('/mesh/scan', methods=['POST'])
-def mesh_scan():
+async def mesh_scan():
     """Scan for unprovisioned Bluetooth Mesh devices"""
     try:
-        data = request.get_json() or {}
+        data = await request_json()
         prefix = data.get('prefix', 'DART TARGETS')
         timeout = data.get('timeout', 10.0)
         
@@ -179,7 +342,7 @@ def mesh_scan():
         if mesh_provisioner is None:
             mesh_provisioner = MeshProvisioner(mesh_network)
         
-        unprovisioned = run_async(mesh_provisioner.scan_unprovisioned_devices(prefix, timeout))
+        unprovisioned = await mesh_provisioner.scan_unprovisioned_devices(prefix, timeout)
         
         devices_info = [
             {"name": node.name, "address": node.address}
@@ -196,10 +359,10 @@ def mesh_scan():
 
 
 @app.route('/mesh/provision', methods=['POST'])
-def mesh_provision():
+async def mesh_provision():
     """Provision Bluetooth Mesh devices"""
     try:
-        data = request.get_json() or {}
+        data = await request_json()
         device_address = data.get('address')  # Optional: provision specific device
         prefix = data.get('prefix', 'DART TARGETS')
         
@@ -212,34 +375,28 @@ def mesh_provision():
             if mesh_provisioner is None:
                 mesh_provisioner = MeshProvisioner(mesh_network)
             
-            # Scan for the specific device
-            unprovisioned = run_async(mesh_provisioner.scan_unprovisioned_devices(prefix))
-            target_node = next((n for n in unprovisioned if n.address == device_address), None)
-            
-            if not target_node:
-                return jsonify({"error": "Device not found"}), 404
-            
-            success = run_async(mesh_provisioner.provision_device(target_node))
+            # The address is already known - connect directly, no scan
+            node = await mesh_provisioner.provision_device(device_address)
             
             return jsonify({
-                "status": "success" if success else "failed",
+                "status": "success" if node else "failed",
                 "device": {
-                    "name": target_node.name,
-                    "address": target_node.address,
-                    "unicast_address": f"{target_node.unicast_address:#06x}" if target_node.unicast_address else None,
-                    "provisioned": target_node.provisioned
+                    "name": node.name if node else None,
+                    "address": device_address,
+                    "unicast_address": node.unicast_hex if node else None,
+                    "provisioned": node is not None
                 }
             })
         else:
             # Provision all available devices
-            mesh_network = run_async(discover_and_provision(prefix))
+            mesh_network = await discover_and_provision(prefix)
             mesh_provisioner = MeshProvisioner(mesh_network)
             
             provisioned_devices = [
                 {
                     "name": node.name,
                     "address": node.address,
-                    "unicast_address": f"{node.unicast_address:#06x}" if node.unicast_address else None,
+                    "unicast_address": node.unicast_hex,
                     "provisioned": node.provisioned
                 }
                 for node in mesh_network.nodes.values()
@@ -256,10 +413,10 @@ def mesh_provision():
 
 
 @app.route('/mesh/send', methods=['POST'])
-def mesh_send():
+async def mesh_send():
     """Send message to Bluetooth Mesh node"""
     try:
-        data = request.get_json()
+        data = await request_json()
         destination = data.get('destination')  # Unicast address (hex string or int)
         message_type = data.get('type', 'onoff')  # onoff, level, sensor
         payload = data.get('payload', {})
@@ -270,28 +427,15 @@ def mesh_send():
         if mesh_provisioner is None or mesh_network is None:
             return jsonify({"error": "Mesh network not initialized. Provision devices first."}), 400
         
-        # Convert destination address
-        if isinstance(destination, str):
-            dest_addr = int(destination, 16)
-        else:
-            dest_addr = int(destination)
+        dest_addr = parse_mesh_address(destination)
         
         # Create message based on type
-        if message_type == 'onoff':
-            on_off = payload.get('on', True)
-            acknowledged = payload.get('acknowledged', True)
-            message = create_onoff_command(on_off, acknowledged)
-        elif message_type == 'level':
-            level = payload.get('level', 0)
-            message = create_level_command(level)
-        elif message_type == 'sensor':
-            property_id = payload.get('property_id')
-            message = create_sensor_query(property_id)
-        else:
+        message = build_mesh_message(message_type, payload)
+        if message is None:
             return jsonify({"error": f"Unknown message type: {message_type}"}), 400
         
         # Send message
-        success = run_async(mesh_provisioner.send_mesh_message(dest_addr, message.opcode, message.payload))
+        success = await mesh_provisioner.send_mesh_message(dest_addr, message.opcode, message.payload)
         
         return jsonify({
             "status": "success" if success else "failed",
@@ -305,7 +449,7 @@ def mesh_send():
 
 
 @app.route('/mesh/status', methods=['GET'])
-def mesh_status():
+async def mesh_status():
     """Get Bluetooth Mesh network status"""
     try:
         if mesh_network is None:
@@ -314,43 +458,51 @@ def mesh_status():
                 "message": "Mesh network not initialized"
             })
         
-        return jsonify({
-            "status": "initialized",
-            "network_name": mesh_network.network_name,
-            "network_key_index": mesh_network.network_key_index,
-            "app_key_index": mesh_network.app_key_index,
-            "provisioner_address": f"{mesh_network.provisioner_address:#06x}",
-            "next_unicast_address": f"{mesh_network.next_unicast_address:#06x}",
-            "provisioned_nodes_count": len(mesh_network.nodes)
-        })
+        return cached_json(
+            "mesh_status",
+            (id(mesh_network), mesh_network.version),
+            lambda: {
+                "status": "initialized",
+                "network_name": mesh_network.network_name,
+                "network_key_index": mesh_network.network_key_index,
+                "app_key_index": mesh_network.app_key_index,
+                "provisioner_address": f"{mesh_network.provisioner_address:#06x}",
+                "next_unicast_address": mesh_network.next_unicast_hex,
+                "provisioned_nodes_count": len(mesh_network.nodes)
+            }
+        )
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 @app.route('/mesh/nodes', methods=['GET'])
-def mesh_nodes():
+async def mesh_nodes():
     """Get list of provisioned mesh nodes"""
     try:
         if mesh_network is None:
             return jsonify({"error": "Mesh network not initialized"}), 400
         
-        nodes_info = [
-            {
-                "name": node.name,
-                "ble_address": node.address,
-                "unicast_address": f"{node.unicast_address:#06x}" if node.unicast_address else None,
-                "provisioned": node.provisioned,
-                "connected": node.client.is_connected if node.client else False,
-                "elements_count": len(node.elements)
+        def render_nodes():
+            # Node dicts go straight into the payload; orjson encodes the
+            # whole structure in one pass with no intermediate copies
+            nodes = mesh_network.nodes
+            return {
+                "status": "success",
+                "nodes": [
+                    {
+                        "name": node.name,
+                        "ble_address": node.address,
+                        "unicast_address": node.unicast_hex,
+                        "provisioned": node.provisioned,
+                        "connected": node.client.is_connected if node.client else False,
+                        "elements_count": len(node.elements)
+                    }
+                    for node in nodes.values()
+                ],
+                "count": len(nodes)
             }
-            for node in mesh_network.nodes.values()
-        ]
         
-        return jsonify({
-            "status": "success",
-            "nodes": nodes_info,
-            "count": len(nodes_info)
-        })
+        return cached_json("mesh_nodes", (id(mesh_network), mesh_network.version), render_nodes)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
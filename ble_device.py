@@ -1,5 +1,14 @@
 # Author: Omi Shrestha
 
+import array
+import asyncio
+import time
+from collections import deque
+
+NOTIFICATION_HISTORY_SIZE = 100     # Notifications kept per device
+VOLTAGE_HISTORY_SIZE = 1024         # Voltage samples kept per device
+
+
 class BLEDevice:
     """Represents a BLE device with connection and data tracking capabilities."""
     
@@ -8,7 +17,21 @@ class BLEDevice:
         self.address = address              # BLE address of the device
         self.client = None                  # GATT client instance
         self.connected = False              # Connection status
+        self.lock = asyncio.Lock()          # Serializes connects to this device only
+        self.reconnect_count = 0            # Connects that reused an existing client
         self.last_voltage = None            # Last reported voltage
         self.last_notification = None       # Last received notification
-        self.notification_history = []      # Store recent notifications
+        self.notification_seq = 0           # Bumped on every notification
+        self.notification_history = deque(maxlen=NOTIFICATION_HISTORY_SIZE)  # Recent notifications
         self.data = {}                      # Store parsed data from notifications
+        self.voltage_ts = array.array('d')  # Voltage sample timestamps (epoch seconds)
+        self.voltage_v = array.array('d')   # Voltage sample values, parallel to voltage_ts
+    
+    def record_voltage(self, value):
+        """Append a voltage sample to the timestamp/value columns."""
+        self.voltage_ts.append(time.time())
+        self.voltage_v.append(value)
+        # Trim in bulk once the columns reach twice the cap (amortized O(1))
+        if len(self.voltage_v) >= 2 * VOLTAGE_HISTORY_SIZE:
+            del self.voltage_ts[:-VOLTAGE_HISTORY_SIZE]
+            del self.voltage_v[:-VOLTAGE_HISTORY_SIZE]
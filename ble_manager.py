@@ -8,12 +8,15 @@ For new code, use main.py or import from individual modules.
 """
 
 import asyncio
+import logging
 from ble_device import BLEDevice
 from ble_utils import (
-    discover_devices as _discover_devices,
+    scan_devices,
+    interactive_select,
     ensure_connected as _ensure_connected,
     send_command as _send_command,
     disconnect_device,
+    device_registry,
     CMD_CHAR_UUID,
     EVT_CHAR_UUID,
     MESH_ANDROID_APP_ADDR
@@ -24,24 +27,27 @@ from notification_handler import (
     get_notification_history
 )
 
-# Global devices dictionary for backward compatibility
+# Global devices dictionary for backward compatibility, set as the device registry
 devices = {}
+device_registry.set(devices)
 
 
 # Wrapper functions to maintain backward compatibility
 async def discover_devices():
     """Discover BLE devices (legacy wrapper)."""
-    await _discover_devices(devices)
+    device = await interactive_select(await scan_devices())
+    if device:
+        devices[device.target_id] = device
 
 
 async def ensure_connected(device):
     """Ensure device is connected (legacy wrapper)."""
-    await _ensure_connected(device, devices)
+    await _ensure_connected(device)
 
 
 async def send_command(target_id, command, value=None):
     """Send command to device (legacy wrapper)."""
-    await _send_command(target_id, command, value, devices)
+    await _send_command(target_id, command, value)
 
 
 # Main function to test scanning
@@ -89,4 +95,6 @@ async def main():
 
 
 if __name__ == "__main__":
+    # Show notifications; use level=logging.DEBUG for parse details and hex dumps
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     asyncio.run(main())
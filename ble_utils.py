@@ -1,6 +1,8 @@
 # Author: Omi Shrestha
 
 import asyncio
+from contextvars import ContextVar
+from typing import Dict, Optional
 from bleak import BleakClient, BleakScanner
 from ble_device import BLEDevice
 from notification_handler import handle_notify
@@ -12,89 +14,134 @@ EVT_CHAR_UUID = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"  # NUS TX - Pi receives e
 # Mesh network configuration
 MESH_ANDROID_APP_ADDR = 0x0001  # RPi identifies as Android app to receive notifications
 
+# Registry of known devices (target_id -> BLEDevice) used by send_command.
+# There is no default dict: each entry point sets its own registry.
+device_registry: ContextVar[Optional[Dict[str, BLEDevice]]] = ContextVar('ble_devices', default=None)
 
-# Discover and Select BLE devices near the RPi
-async def discover_devices(devices_dict, device_name_prefix="DART TARGETS"):
+
+# Discover BLE devices near the RPi
+async def scan_devices(device_name_prefix="DART TARGETS", timeout=5.0, settle=0.5):
     """
-    Scan for BLE devices and allow user to select one.
+    Scan for BLE devices whose name starts with a prefix.
+    
+    The scan ends shortly after the first matching advertisement instead of
+    always running for the full timeout.
     
     Args:
-        devices_dict: Dictionary to store discovered devices
         device_name_prefix: Prefix to filter device names
+        timeout: Maximum scan time in seconds if nothing matches
+        settle: Extra listening time after the first match, so other boards
+            advertising nearby are still picked up
+    
+    Returns:
+        List of (name, address, target_id) tuples for matching devices
     """
     print("Scanning for BLE devices...")
-    found = await BleakScanner.discover()
+    match_found = asyncio.Event()
+    
+    def detection_callback(device, adv_data):
+        if device.name and device.name.startswith(device_name_prefix):
+            match_found.set()
+    
+    async with BleakScanner(detection_callback=detection_callback) as scanner:
+        try:
+            await asyncio.wait_for(match_found.wait(), timeout=timeout)
+            await asyncio.sleep(settle)
+        except asyncio.TimeoutError:
+            pass
+    
     discovered = []
     
     # Filter devices by name prefix
-    for d in found:
+    for d in scanner.discovered_devices:
         if d.name and d.name.startswith(device_name_prefix):
             target_id = d.name.split("-")[-1] if "-" in d.name else "Unknown"
             discovered.append((d.name, d.address, target_id))
     
+    return discovered
+
+
+# Select one of the discovered devices (CLI only - reads stdin)
+async def interactive_select(discovered):
+    """
+    Let the user choose one of the scanned devices.
+    
+    Args:
+        discovered: List of (name, address, target_id) tuples from scan_devices
+    
+    Returns:
+        BLEDevice for the selected device, or None if nothing was selected
+    """
     if not discovered:
         print("No devices found.")
-        return
+        return None
     
-    # If multiple devices found, let the user choose one to connect
+    # If only one device found, use it automatically
     num_devices = len(discovered)
-    if num_devices > 1:
-        print(f"\nFound {num_devices} devices:")
-        for idx, (name, addr, tid) in enumerate(discovered, 1):
-            print(f"  {idx}. {name} - MAC: {addr} (ID: {tid})")
-        
-        # Get user's choice
-        while True:
-            try:
-                choice = await asyncio.to_thread(input, f"\nSelect device (1-{num_devices}): ")
-                choice_idx = int(choice) - 1
-                if 0 <= choice_idx < num_devices:
-                    selected = discovered[choice_idx]
-                    devices_dict[selected[2]] = BLEDevice(selected[2], selected[1])
-                    print(f"Selected: {selected[0]} ({selected[1]})")
-                    break
-                else:
-                    print("Invalid selection. Try again.")
-            except ValueError:
-                print("Please enter a number.")
-            except (EOFError, KeyboardInterrupt):
-                print("\nSelection cancelled.")
-                return
-    else:
-        # If only one device found, use it automatically
+    if num_devices == 1:
         name, addr, tid = discovered[0]
-        devices_dict[tid] = BLEDevice(tid, addr)
         print(f"Found 1 device: {name} - MAC: {addr}")
+        return BLEDevice(tid, addr)
     
-    print("Registered devices:", list(devices_dict.keys()))
-
-
-async def ensure_connected(device: BLEDevice, devices_dict):
+    # If multiple devices found, let the user choose one to connect
+    print(f"\nFound {num_devices} devices:")
+    for idx, (name, addr, tid) in enumerate(discovered, 1):
+        print(f"  {idx}. {name} - MAC: {addr} (ID: {tid})")
+    
+    # Get user's choice
+    while True:
+        try:
+            choice = await asyncio.to_thread(input, f"\nSelect device (1-{num_devices}): ")
+            choice_idx = int(choice) - 1
+            if 0 <= choice_idx < num_devices:
+                name, addr, tid = discovered[choice_idx]
+                print(f"Selected: {name} ({addr})")
+                return BLEDevice(tid, addr)
+            else:
+                print("Invalid selection. Try again.")
+        except ValueError:
+            print("Please enter a number.")
+        except (EOFError, KeyboardInterrupt):
+            print("\nSelection cancelled.")
+            return None
+
+
+async def ensure_connected(device: BLEDevice):
     """
     Ensure a BLE device is connected and subscribed to notifications.
     
     Args:
         device: BLEDevice instance to connect
-        devices_dict: Dictionary of all devices (passed to notification handler)
     """
     if device.client and device.client.is_connected:
         return
 
-    device.client = BleakClient(device.address)
-    await device.client.connect()
-    device.connected = True
-    print(f"[BLE] Connected to {device.target_id}")
-
-    # Wait for service discovery
-    await asyncio.sleep(2)
-    
-    # Subscribe to event notifications with device-specific callback
-    def device_notify_handler(sender, data: bytearray):
-        handle_notify(device, data, devices_dict)
-    
-    await device.client.start_notify(EVT_CHAR_UUID, device_notify_handler)
-    print(f"[BLE] Subscribed to notifications for {device.target_id}")
-    print(f"[BLE] Notification handler registered - ready to receive data")
+    # Per-device lock: concurrent requests for the same device share one
+    # connect, while other devices connect in parallel on the same loop
+    async with device.lock:
+        if device.client and device.client.is_connected:
+            return
+
+        # Reuse the device's client across reconnects. connect() returns
+        # only after service discovery, so no settle delay is needed.
+        reconnect = device.client is not None
+        if not reconnect:
+            device.client = BleakClient(device.address)
+        await device.client.connect()
+        device.connected = True
+        print(f"[BLE] Connected to {device.target_id}")
+
+        if reconnect:
+            device.reconnect_count += 1
+            print(f"[BLE] Reconnected to {device.target_id} (reconnect #{device.reconnect_count})")
+        
+        # Subscribe to event notifications with device-specific callback
+        def device_notify_handler(sender, data: bytearray):
+            handle_notify(device, data)
+        
+        await device.client.start_notify(EVT_CHAR_UUID, device_notify_handler)
+        print(f"[BLE] Subscribed to notifications for {device.target_id}")
+        print(f"[BLE] Notification handler registered - ready to receive data")
     
     # Register as mesh address 0x0001 to receive firmware notifications (optional)
     # Uncomment if your firmware requires mesh registration
@@ -105,21 +152,21 @@ async def ensure_connected(device: BLEDevice, devices_dict):
     # await asyncio.sleep(0.5)
 
 
-async def send_command(target_id, command, value, devices_dict):
+async def send_command(target_id, command, value=None):
     """
-    Send a command to a BLE device.
+    Send a command to a BLE device registered in device_registry.
     
     Args:
         target_id: ID of the target device
         command: Command string to send
         value: Optional value parameter
-        devices_dict: Dictionary of all devices
     """
-    if target_id not in devices_dict:
+    devices_dict = device_registry.get()
+    if devices_dict is None or target_id not in devices_dict:
         raise Exception("Unknown target")
 
     device = devices_dict[target_id]
-    await ensure_connected(device, devices_dict)
+    await ensure_connected(device)
 
     if value is not None:
         packet = f"{target_id}:{command}:{value}\n"
@@ -1,16 +1,23 @@
 # Author: Omi Shrestha
 
 import asyncio
-from ble_utils import discover_devices, ensure_connected, disconnect_device, CMD_CHAR_UUID
+import logging
+from ble_utils import (
+    scan_devices, interactive_select, ensure_connected, disconnect_device,
+    device_registry, CMD_CHAR_UUID
+)
 from notification_handler import get_device_data, get_notification_history
 
-# Global devices dictionary
+# Global devices dictionary, set as the device registry send_command uses
 devices = {}
+device_registry.set(devices)
 
 
 async def main():
     """Main application entry point."""
-    await discover_devices(devices)
+    device = await interactive_select(await scan_devices())
+    if device:
+        devices[device.target_id] = device
     
     if not devices:
         print("\nNo devices found.")
@@ -23,7 +30,7 @@ async def main():
     # Test connection to first device
     first_device = list(devices.values())[0]
     print(f"\nAttempting to connect to {first_device.target_id}...")
-    await ensure_connected(first_device, devices)
+    await ensure_connected(first_device)
     print("Connected!")
     print("\n" + "="*50)
     print("NOTIFICATION RECEIVER ACTIVE")
@@ -85,4 +92,6 @@ async def main():
 
 
 if __name__ == "__main__":
+    # Show notifications; use level=logging.DEBUG for parse details and hex dumps
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     asyncio.run(main())
@@ -4,9 +4,12 @@ Interactive CLI for provisioning and controlling mesh devices
 """
 
 import asyncio
+import logging
 from mesh_provisioner import interactive_mesh_control
 
 if __name__ == "__main__":
+    # Use level=logging.DEBUG for raw provisioning/proxy PDU dumps
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     try:
         asyncio.run(interactive_mesh_control())
     except KeyboardInterrupt:
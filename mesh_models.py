@@ -8,6 +8,24 @@ from enum import IntEnum
 from typing import Optional, List
 from dataclasses import dataclass
 
+# Precompiled wire formats (little-endian, opcode first)
+_OPCODE_U16 = struct.Struct('<H')       # Opcode only (GET messages)
+_ONOFF_STATUS = struct.Struct('<HB')    # Opcode + Present OnOff
+_LEVEL_STATUS = struct.Struct('<Hh')    # Opcode + Present Level
+_SENSOR = struct.Struct('<Bf')          # Sensor type + float value
+_APPKEY_HDR = struct.Struct('<BHB')     # Opcode + packed key indices
+_BIND = struct.Struct('<BHHH')          # Opcode + element + app key + model
+_LEVEL_PARAMS = struct.Struct('<hB')    # Level + TID
+
+# Big-endian opcode bytes used by the create_*_command helpers
+_OPCODE_ONOFF_SET = b'\x82\x02'         # GENERIC_ONOFF_SET
+_OPCODE_LEVEL_SET = b'\x82\x06'         # GENERIC_LEVEL_SET
+
+# SET layouts indexed by the number of optional trailing bytes present
+# (0, transition time, transition time + delay) - one pack call per PDU
+_ONOFF_SET_LAYOUTS = tuple(struct.Struct('<HBB' + 'B' * n) for n in range(3))  # Opcode + OnOff + TID
+_LEVEL_SET_LAYOUTS = tuple(struct.Struct('<Hhb' + 'B' * n) for n in range(3))  # Opcode + Level + TID
+
 class MeshOpcode(IntEnum):
     """Standard Bluetooth Mesh opcodes"""
     # Generic OnOff Model
@@ -47,20 +65,20 @@ class GenericOnOffMessage:
         opcode = MeshOpcode.GENERIC_ONOFF_SET if acknowledged else MeshOpcode.GENERIC_ONOFF_SET_UNACK
         
         # Opcode (2 bytes) + OnOff (1 byte) + TID (1 byte)
-        data = struct.pack('<HBB', opcode, 1 if self.onoff else 0, self.tid)
+        fields = [opcode, 1 if self.onoff else 0, self.tid]
         
         # Optional transition time and delay
         if self.transition_time is not None:
-            data += struct.pack('<B', self.transition_time)
+            fields.append(self.transition_time)
             if self.delay is not None:
-                data += struct.pack('<B', self.delay)
+                fields.append(self.delay)
         
-        return data
+        return _ONOFF_SET_LAYOUTS[len(fields) - 3].pack(*fields)
     
     @staticmethod
     def encode_get() -> bytes:
         """Encode as GET message"""
-        return struct.pack('<H', MeshOpcode.GENERIC_ONOFF_GET)
+        return _OPCODE_U16.pack(MeshOpcode.GENERIC_ONOFF_GET)
     
     @staticmethod
     def decode_status(data: bytes) -> 'GenericOnOffMessage':
@@ -68,7 +86,7 @@ class GenericOnOffMessage:
         if len(data) < 3:
             raise ValueError("Invalid Generic OnOff Status message")
         
-        opcode, onoff = struct.unpack('<HB', data[:3])
+        opcode, onoff = _ONOFF_STATUS.unpack_from(data, 0)
         if opcode != MeshOpcode.GENERIC_ONOFF_STATUS:
             raise ValueError(f"Invalid opcode: 0x{opcode:04x}")
         
@@ -94,19 +112,19 @@ class GenericLevelMessage:
         opcode = MeshOpcode.GENERIC_LEVEL_SET if acknowledged else MeshOpcode.GENERIC_LEVEL_SET_UNACK
         
         # Opcode (2 bytes) + Level (2 bytes signed) + TID (1 byte)
-        data = struct.pack('<Hhb', opcode, self.level, self.tid)
+        fields = [opcode, self.level, self.tid]
         
         if self.transition_time is not None:
-            data += struct.pack('<B', self.transition_time)
+            fields.append(self.transition_time)
             if self.delay is not None:
-                data += struct.pack('<B', self.delay)
+                fields.append(self.delay)
         
-        return data
+        return _LEVEL_SET_LAYOUTS[len(fields) - 3].pack(*fields)
     
     @staticmethod
     def encode_get() -> bytes:
         """Encode as GET message"""
-        return struct.pack('<H', MeshOpcode.GENERIC_LEVEL_GET)
+        return _OPCODE_U16.pack(MeshOpcode.GENERIC_LEVEL_GET)
     
     @staticmethod
     def decode_status(data: bytes) -> 'GenericLevelMessage':
@@ -114,7 +132,7 @@ class GenericLevelMessage:
         if len(data) < 4:
             raise ValueError("Invalid Generic Level Status message")
         
-        opcode, level = struct.unpack('<Hh', data[:4])
+        opcode, level = _LEVEL_STATUS.unpack_from(data, 0)
         if opcode != MeshOpcode.GENERIC_LEVEL_STATUS:
             raise ValueError(f"Invalid opcode: 0x{opcode:04x}")
         
@@ -129,7 +147,7 @@ class SensorMessage:
     def encode(self) -> bytes:
         """Encode sensor data"""
         # Custom vendor format: type (1 byte) + value (4 bytes float)
-        return struct.pack('<Bf', self.sensor_type, self.value)
+        return _SENSOR.pack(self.sensor_type, self.value)
     
     @staticmethod
     def decode(data: bytes) -> 'SensorMessage':
@@ -137,7 +155,7 @@ class SensorMessage:
         if len(data) < 5:
             raise ValueError("Invalid Sensor message")
         
-        sensor_type, value = struct.unpack('<Bf', data[:5])
+        sensor_type, value = _SENSOR.unpack_from(data, 0)
         return SensorMessage(sensor_type=sensor_type, value=value)
 
 @dataclass
@@ -153,16 +171,21 @@ class ConfigMessage:
         # Pack key indices (12 bits each)
         key_indices = (net_key_index & 0xFFF) | ((app_key_index & 0xFFF) << 12)
         
-        return struct.pack('<BHB', 
+        # Header and key written into one buffer - no concatenation copy
+        buf = bytearray(_APPKEY_HDR.size + 16)
+        _APPKEY_HDR.pack_into(
+            buf, 0,
             MeshOpcode.CONFIG_APPKEY_ADD,
             key_indices & 0xFFFF,
             (key_indices >> 16) & 0xFF
-        ) + app_key
+        )
+        buf[_APPKEY_HDR.size:] = app_key
+        return bytes(buf)
     
     @staticmethod
     def encode_model_app_bind(element_address: int, app_key_index: int, model_id: int) -> bytes:
         """Encode Config Model App Bind message"""
-        return struct.pack('<BHHH',
+        return _BIND.pack(
             MeshOpcode.CONFIG_MODEL_APP_BIND,
             element_address,
             app_key_index,
@@ -202,11 +225,10 @@ def create_onoff_command(target_address: int, onoff: bool, tid: int = 0) -> dict
     Returns:
         Dictionary with command parameters
     """
-    msg = GenericOnOffMessage(onoff=onoff, tid=tid)
     return {
         "dst": target_address,
-        "opcode": bytes([0x82, 0x02]),  # GENERIC_ONOFF_SET
-        "params": struct.pack('BB', 1 if onoff else 0, tid)
+        "opcode": _OPCODE_ONOFF_SET,
+        "params": bytes((1 if onoff else 0, tid))
     }
 
 def create_level_command(target_address: int, level: int, tid: int = 0) -> dict:
@@ -221,9 +243,8 @@ def create_level_command(target_address: int, level: int, tid: int = 0) -> dict:
     Returns:
         Dictionary with command parameters
     """
-    msg = GenericLevelMessage(level=level, tid=tid)
     return {
         "dst": target_address,
-        "opcode": bytes([0x82, 0x06]),  # GENERIC_LEVEL_SET
-        "params": struct.pack('<hB', level, tid)
+        "opcode": _OPCODE_LEVEL_SET,
+        "params": _LEVEL_PARAMS.pack(level, tid)
     }
@@ -5,10 +5,11 @@ Handles mesh network provisioning and device management
 """
 
 import asyncio
+import logging
 import struct
 import secrets
-from typing import Optional, List, Dict, Tuple
-from dataclasses import dataclass
+from typing import Optional, List, Dict, Tuple, Union
+from dataclasses import dataclass, field
 from bleak import BleakClient, BleakScanner
 from bleak.backends.device import BLEDevice
 
@@ -20,6 +21,22 @@ MESH_PROXY_SERVICE =            "00001828-0000-1000-8000-00805f9b34fb"
 MESH_PROXY_DATA_IN =            "00002add-0000-1000-8000-00805f9b34fb"
 MESH_PROXY_DATA_OUT =           "00002ade-0000-1000-8000-00805f9b34fb"
 
+logger = logging.getLogger(__name__)
+
+# Lowercased once for the per-advertisement scan filter
+_MESH_PROV_UUID_LC = MESH_PROVISIONING_SERVICE.lower()
+
+# Proxy PDU Link Control byte -> queue message kind
+_PROXY_TYPES = {
+    0x00: 'network',    # Network PDU
+    0x01: 'beacon',     # Mesh Beacon
+    0x02: 'config',     # Proxy Configuration
+}
+
+# Provisioning Invite PDUs (Transaction Start, Invite, attention seconds)
+# indexed by attention duration
+_INVITE_PACKETS = tuple(bytes((0x03, 0x00, i)) for i in range(256))
+
 @dataclass
 class MeshNode:
     """Represents a provisioned mesh node"""
@@ -30,6 +47,28 @@ class MeshNode:
     name: str
     elements: int = 1
     network_key_index: int = 0
+    unicast_hex: Optional[str] = field(init=False, repr=False)  # e.g. "0x0002"
+    _cached_status: Optional[Dict] = field(default=None, init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        # Unicast address is fixed once provisioned - format it once
+        self.unicast_hex = f"{self.unicast_address:#06x}" if self.unicast_address else None
+    
+    def as_status_dict(self) -> Dict:
+        """Status entry for this node, built once and copied per call.
+        
+        Callers get their own dict, so editing it cannot corrupt the cache.
+        Nodes are not modified after provisioning; anything that does change
+        a field must reset _cached_status to None.
+        """
+        if self._cached_status is None:
+            self._cached_status = {
+                "name": self.name,
+                "address": self.address,
+                "unicast_address": self.unicast_hex,
+                "elements": self.elements
+            }
+        return dict(self._cached_status)
 
 @dataclass
 class MeshNetwork:
@@ -39,10 +78,31 @@ class MeshNetwork:
     iv_index: int = 0
     next_unicast_address: int = 0x0001
     nodes: Dict[int, MeshNode] = None
+    version: int = 0        # Bumped whenever nodes or address allocation change
+    next_unicast_hex: str = field(init=False, repr=False)
+    network_key_hex: str = field(init=False, repr=False)
+    app_key_hex: str = field(init=False, repr=False)
     
     def __post_init__(self):
         if self.nodes is None:
             self.nodes = {}
+        self.next_unicast_hex = f"{self.next_unicast_address:#06x}"
+        # Keys don't rotate in this flow - hex them once
+        self.network_key_hex = self.network_key.hex()
+        self.app_key_hex = self.app_key.hex()
+    
+    def allocate_unicast(self, count: int) -> int:
+        """Reserve count consecutive unicast addresses and return the first"""
+        address = self.next_unicast_address
+        self.next_unicast_address += count
+        self.next_unicast_hex = f"{self.next_unicast_address:#06x}"
+        self.version += 1
+        return address
+    
+    def add_node(self, node: MeshNode):
+        """Register a provisioned node under its unicast address"""
+        self.nodes[node.unicast_address] = node
+        self.version += 1
 
 class MeshProvisioner:
     """
@@ -58,7 +118,9 @@ class MeshProvisioner:
             app_key=app_key or secrets.token_bytes(16)
         )
         self.client: Optional[BleakClient] = None
-        self._prov_notification_queue = asyncio.Queue()
+        # Provisioning is strict request/response: one future per awaited PDU
+        self._prov_pdu_waiter: Optional[asyncio.Future] = None
+        # Proxy traffic can arrive unsolicited, so it keeps a queue
         self._proxy_notification_queue = asyncio.Queue()
         self._expected_pdu_length = 0
         self._pdu_buffer = bytearray()
@@ -75,22 +137,31 @@ class MeshProvisioner:
         
         def detection_callback(device: BLEDevice, adv_data):
             """Filter devices during scan"""
-            # Only process devices named "DART TARGETS"
-            if device.name != "DART TARGETS":
+            # Avoid duplicates - checked first since accepted devices keep
+            # advertising and make up most callbacks after the first second
+            if device.address in seen_addresses:
                 return
             
-            # Avoid duplicates
-            if device.address in seen_addresses:
+            # Only process devices named "DART TARGETS"
+            if device.name != "DART TARGETS":
                 return
             
             # Check if device advertises Mesh Provisioning Service
-            if MESH_PROVISIONING_SERVICE.lower() in [uuid.lower() for uuid in adv_data.service_uuids]:
+            service_uuids = adv_data.service_uuids
+            if not service_uuids:
+                return
+            if any(uuid.lower() == _MESH_PROV_UUID_LC for uuid in service_uuids):
                 print(f"[MESH] Found unprovisioned device: {device.name} ({device.address})")
                 mesh_devices.append(device)
                 seen_addresses.add(device.address)
         
-        # Scan with callback - only processes matching devices
-        scanner = BleakScanner(detection_callback=detection_callback)
+        # Let BlueZ drop adverts without the provisioning service before they
+        # reach Python; the callback still checks name and UUID since not
+        # every backend honours the filter
+        scanner = BleakScanner(
+            detection_callback=detection_callback,
+            service_uuids=[MESH_PROVISIONING_SERVICE]
+        )
         await scanner.start()
         await asyncio.sleep(timeout)
         await scanner.stop()
@@ -100,10 +171,11 @@ class MeshProvisioner:
     
     def _prov_notification_handler(self, sender, data: bytearray):
         """Handle provisioning notifications"""
-        print(f"[MESH] <<< Received provisioning data ({len(data)} bytes): {data.hex()}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[MESH] <<< Received provisioning data (%d bytes): %s", len(data), data.hex())
         
         if len(data) < 2:
-            print(f"[MESH] WARNING: Received data too short ({len(data)} bytes)")
+            logger.warning("[MESH] Received data too short (%d bytes)", len(data))
             return
             
         # Parse GATT Bearer header (Android nRF Mesh format)
@@ -112,47 +184,50 @@ class MeshProvisioner:
         
         if link_control == 0x03:  # Transaction Start
             # Complete PDU is in this packet
-            complete_pdu = bytes(data[1:])  # Skip link control, rest is the PDU
-            print(f"[MESH] >>> Complete PDU received ({len(complete_pdu)} bytes): {complete_pdu.hex()}")
-            self._prov_notification_queue.put_nowait(complete_pdu)
+            # Skip link control, rest is the PDU (zero-copy view; bleak hands
+            # each notification its own buffer)
+            complete_pdu = memoryview(data)[1:]
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("[MESH] >>> Complete PDU received (%d bytes): %s", len(complete_pdu), complete_pdu.hex())
+            waiter = self._prov_pdu_waiter
+            if waiter is not None and not waiter.done():
+                waiter.set_result(complete_pdu)
+            else:
+                logger.warning("[MESH] Unexpected provisioning PDU - no step is waiting for it")
         elif link_control == 0x02:  # Transaction Continuation
             # This shouldn't happen with large MTU, but handle it
-            print(f"[MESH] WARNING: Received continuation packet (shouldn't happen with MTU 498)")
-            print(f"[MESH] Data: {data.hex()}")
+            logger.warning("[MESH] Received continuation packet (shouldn't happen with MTU 498)")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("[MESH] Data: %s", data.hex())
         else:
-            print(f"[MESH] WARNING: Unknown Link Control: 0x{link_control:02x}")
+            logger.warning("[MESH] Unknown Link Control: 0x%02x", link_control)
     
     def _proxy_notification_handler(self, sender, data: bytearray):
         """Handle proxy notifications - receives mesh network messages"""
-        print(f"[MESH] <<< Received proxy data ({len(data)} bytes): {data.hex()}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[MESH] <<< Received proxy data (%d bytes): %s", len(data), data.hex())
         
         # Proxy messages use the same Link Control format
         if len(data) < 2:
-            print(f"[MESH] WARNING: Received data too short ({len(data)} bytes)")
+            logger.warning("[MESH] Received data too short (%d bytes)", len(data))
             return
             
-        link_control = data[0]
+        kind = _PROXY_TYPES.get(data[0])
+        if kind is None:
+            logger.warning("[MESH] Unknown proxy message type: 0x%02x", data[0])
+            return
         
-        if link_control == 0x00:  # Network PDU
-            # This is an encrypted mesh network message
-            complete_pdu = bytes(data[1:])
-            print(f"[MESH] >>> Network PDU received ({len(complete_pdu)} bytes)")
-            self._proxy_notification_queue.put_nowait(('network', complete_pdu))
-        elif link_control == 0x01:  # Mesh Beacon
-            complete_pdu = bytes(data[1:])
-            print(f"[MESH] >>> Mesh Beacon received ({len(complete_pdu)} bytes)")
-            self._proxy_notification_queue.put_nowait(('beacon', complete_pdu))
-        elif link_control == 0x02:  # Proxy Configuration
-            complete_pdu = bytes(data[1:])
-            print(f"[MESH] >>> Proxy Config received ({len(complete_pdu)} bytes)")
-            self._proxy_notification_queue.put_nowait(('config', complete_pdu))
-        else:
-            print(f"[MESH] WARNING: Unknown proxy message type: 0x{link_control:02x}")
+        complete_pdu = memoryview(data)[1:]
+        logger.debug("[MESH] >>> Proxy %s PDU received (%d bytes)", kind, len(complete_pdu))
+        self._proxy_notification_queue.put_nowait((kind, complete_pdu))
     
-    async def provision_device(self, device: BLEDevice, timeout: float = 15.0) -> Optional[MeshNode]:
+    async def provision_device(self, device: Union[BLEDevice, str], timeout: float = 15.0) -> Optional[MeshNode]:
         """
         Provision a mesh device
         
+        device may be a scanned BLEDevice or just its BLE address when the
+        address is already known, which avoids a separate scan.
+        
         Simplified provisioning flow:
         1. Connect and subscribe to provisioning service
         2. Send Provisioning Invite
@@ -163,7 +238,12 @@ class MeshProvisioner:
         
         Returns MeshNode if successful, None otherwise
         """
-        print(f"[MESH] Starting provisioning for {device.name} ({device.address})")
+        if isinstance(device, str):
+            address, name = device, None
+        else:
+            address, name = device.address, device.name
+        
+        print(f"[MESH] Starting provisioning for {name} ({address})")
         
         provisioned_node = None  # Store result before disconnect
         
@@ -171,11 +251,12 @@ class MeshProvisioner:
             # Reset PDU buffer
             self._pdu_buffer = bytearray()
             self._expected_pdu_length = 0
+            self._prov_pdu_waiter = None
             
             # Connect to device
-            async with BleakClient(device.address, timeout=10.0) as client:
+            async with BleakClient(address, timeout=10.0) as client:
                 self.client = client
-                print(f"[MESH] Connected to {device.name}")
+                print(f"[MESH] Connected to {name or address}")
                 
                 # Exchange MTU to get larger packet size (like Android app)
                 # Android uses 517 which negotiates down to 498
@@ -231,10 +312,12 @@ class MeshProvisioner:
                 # 0x03 = Link Control (Transaction Start)
                 # 0x00 = PDU Type (Provisioning Invite)
                 # 0x05 = Attention Duration (5 seconds)
-                invite_packet = bytes([0x03, 0x00, attention_duration])
+                invite_packet = _INVITE_PACKETS[attention_duration]
                 
                 print(f"[MESH] DEBUG: Invite packet = {invite_packet.hex()}")
                 
+                # Arm the waiter before sending so a fast reply isn't missed
+                self._prov_pdu_waiter = asyncio.get_running_loop().create_future()
                 await client.write_gatt_char(
                     MESH_PROVISIONING_DATA_IN,
                     invite_packet,
@@ -245,7 +328,7 @@ class MeshProvisioner:
                 # Wait for Capabilities response
                 try:
                     capabilities = await asyncio.wait_for(
-                        self._prov_notification_queue.get(),
+                        self._prov_pdu_waiter,
                         timeout=timeout
                     )
                     
@@ -266,25 +349,25 @@ class MeshProvisioner:
                     # - Provisioning data distribution
                     
                     # Allocate unicast address
-                    unicast_address = self.network.next_unicast_address
-                    self.network.next_unicast_address += num_elements
+                    unicast_address = self.network.allocate_unicast(num_elements)
                     
-                    # Generate device key
-                    device_key = secrets.token_bytes(16)
+                    # Device key and UUID from a single getrandom() call
+                    random_material = secrets.token_bytes(32)
+                    device_key = random_material[:16]
                     
                     # Create mesh node
                     node = MeshNode(
-                        address=device.address,
+                        address=address,
                         unicast_address=unicast_address,
                         device_key=device_key,
-                        uuid=secrets.token_bytes(16),  # Should get from device
-                        name=device.name or "Unknown",
+                        uuid=random_material[16:],  # Should get from device
+                        name=name or "Unknown",
                         elements=num_elements
                     )
                     
-                    self.network.nodes[unicast_address] = node
+                    self.network.add_node(node)
                     
-                    print(f"[MESH] ✓ Provisioned {device.name}")
+                    print(f"[MESH] ✓ Provisioned {name or address}")
                     print(f"[MESH]   Unicast Address: 0x{unicast_address:04x}")
                     print(f"[MESH]   Elements: {num_elements}")
                     
@@ -314,20 +397,12 @@ class MeshProvisioner:
     def get_network_status(self) -> Dict:
         """Get current network status"""
         return {
-            "network_key": self.network.network_key.hex(),
-            "app_key": self.network.app_key.hex(),
+            "network_key": self.network.network_key_hex,
+            "app_key": self.network.app_key_hex,
             "iv_index": self.network.iv_index,
-            "next_unicast_address": f"0x{self.network.next_unicast_address:04x}",
+            "next_unicast_address": self.network.next_unicast_hex,
             "provisioned_nodes": len(self.network.nodes),
-            "nodes": [
-                {
-                    "name": node.name,
-                    "address": node.address,
-                    "unicast_address": f"0x{node.unicast_address:04x}",
-                    "elements": node.elements
-                }
-                for node in self.network.nodes.values()
-            ]
+            "nodes": [node.as_status_dict() for node in self.network.nodes.values()]
         }
 
 
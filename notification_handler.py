@@ -1,75 +1,73 @@
 # Author: Omi Shrestha
 
+import json
+import logging
 import time
+from itertools import islice
 
-def handle_notify(device, data: bytearray, devices_dict):
+logger = logging.getLogger(__name__)
+
+
+def handle_notify(device, data: bytearray, devices_dict=None):
     """
     Handle incoming BLE notifications from firmware.
     
     Args:
         device: BLEDevice instance receiving the notification
         data: Raw notification data
-        devices_dict: Dictionary of all devices (for backward compatibility)
+        devices_dict: Unused, kept for backward compatibility
     """
+    device.notification_seq += 1
+    
     try:
         msg = data.decode('utf-8').strip()
     except UnicodeDecodeError:
-        # Handle binary data
-        print(f"[NOTIFICATION] {device.target_id} - Binary data: {data.hex()}")
+        # Handle binary data (hex dump only when debugging)
+        logger.info("[NOTIFICATION] %s - Binary data (%d bytes)", device.target_id, len(data))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("[NOTIFICATION] %s - %s", device.target_id, data.hex())
         device.last_notification = data
         return
     
     timestamp = time.strftime("%H:%M:%S")
-    print(f"[NOTIFICATION] [{timestamp}] {device.target_id} -> {msg}")
+    logger.info("[NOTIFICATION] [%s] %s -> %s", timestamp, device.target_id, msg)
     
-    # Store in history (keep last 100 notifications)
+    # Store in history (bounded deque drops the oldest entry)
     device.notification_history.append({
         'timestamp': timestamp,
         'message': msg,
         'raw_data': data
     })
-    if len(device.notification_history) > 100:
-        device.notification_history.pop(0)
     
     device.last_notification = msg
     
     # Parse different message formats
+    # Format 3: JSON-like messages (checked first - JSON bodies contain ':')
+    if msg.startswith('{') and msg.endswith('}'):
+        try:
+            parsed = json.loads(msg)
+            device.data.update(parsed)
+            logger.debug("  └─ Parsed JSON: %s", parsed)
+        except json.JSONDecodeError:
+            pass
+    
     # Format 1: "key:value" (e.g., "Voltage:12.2", "Temperature:25.5")
-    if ':' in msg:
+    # Format 2: "target_id:key:value" (e.g., "t01:Voltage:12.2")
+    elif ':' in msg:
         parts = msg.split(':')
-        if len(parts) == 2:
-            key, value = parts
-            device.data[key.strip()] = value.strip()
-            print(f"  └─ Parsed: {key.strip()} = {value.strip()}")
+        # Two fields are key:value, three are target_id:key:value
+        if len(parts) == 2 or len(parts) == 3:
+            key, value = parts[-2].strip(), parts[-1].strip()
+            device.data[key] = value
+            logger.debug("  └─ Parsed: %s = %s", key, value)
             
             # Special handling for voltage
             if "Voltage" in key:
                 try:
                     device.last_voltage = float(value)
+                    device.record_voltage(device.last_voltage)
                 except ValueError:
                     pass
-        
-        # Format 2: "target_id:key:value" (e.g., "t01:Voltage:12.2")
-        elif len(parts) == 3:
-            tid, key, value = parts
-            device.data[key.strip()] = value.strip()
-            print(f"  └─ Parsed: {key.strip()} = {value.strip()}")
-            
-            if "Voltage" in key:
-                try:
-                    device.last_voltage = float(value)
-                except ValueError:
-                    pass
-    
-    # Format 3: JSON-like messages
-    elif msg.startswith('{') and msg.endswith('}'):
-        try:
-            import json
-            parsed = json.loads(msg)
-            device.data.update(parsed)
-            print(f"  └─ Parsed JSON: {parsed}")
-        except json.JSONDecodeError:
-            pass
     
     # Format 4: Simple status messages
     else:
@@ -93,4 +91,5 @@ def get_notification_history(target_id, devices_dict, limit=10):
     if target_id not in devices_dict:
         return []
     history = devices_dict[target_id].notification_history
-    return history[-limit:] if len(history) > limit else history
+    # Copy only the newest `limit` entries of the ring buffer, oldest first
+    return list(islice(history, max(0, len(history) - limit), None))
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+# Shared connection helpers for the test scripts
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from bleak import BleakClient, BleakScanner
+from bleak.exc import BleakError
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None  # Optional - falls back to the stock asyncio loop
+
+try:
+    # Passive scanning on BlueZ needs advertisement monitor patterns
+    from bleak.assigned_numbers import AdvertisementDataType
+    from bleak.backends.bluezdbus.advertisement_monitor import OrPattern
+except ImportError:
+    OrPattern = None
+
+# LE connection interval bounds in 1.25 ms units (7.5 ms - 11.25 ms)
+CONN_MIN_INTERVAL = 6
+CONN_MAX_INTERVAL = 9
+
+HCI_DEBUGFS = "/sys/kernel/debug/bluetooth/hci0"
+
+# Tuning changes the adapter-wide defaults for every connection on the Pi,
+# so it only happens when asked for
+TUNE_INTERVAL = os.environ.get("BLE_TUNE_INTERVAL") == "1"
+
+BOARD_NAME_PREFIX = "DART TARGETS"
+
+async def _sudo(*cmd, data=None):
+    """Run cmd under passwordless sudo; returns its stdout, or None on failure"""
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            "sudo", "-n", *cmd,
+            stdin=asyncio.subprocess.PIPE if data is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+    except OSError as e:
+        print(f"Could not run sudo {cmd[0]}: {e}")
+        return None
+    try:
+        out, err = await asyncio.wait_for(proc.communicate(data), timeout=2)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        print(f"sudo {' '.join(cmd)} timed out")
+        return None
+    if proc.returncode != 0:
+        error = err.decode(errors='replace').strip()
+        print(f"sudo {' '.join(cmd)} failed (exit {proc.returncode}): {error}")
+        return None
+    return out.decode()
+
+async def _read_intervals():
+    """Current (min, max) connection interval defaults, or None if unreadable"""
+    values = []
+    for name in ("conn_min_interval", "conn_max_interval"):
+        out = await _sudo("cat", f"{HCI_DEBUGFS}/{name}")
+        if out is None:
+            return None
+        values.append(int(out))
+    return tuple(values)
+
+async def _write_intervals(current, new):
+    """Move the defaults from current to new (min, max); False on failure"""
+    writes = [("conn_min_interval", new[0]), ("conn_max_interval", new[1])]
+    # The kernel rejects a min above the current max and a max below the
+    # current min, so raise max first when moving the range up
+    if new[0] > current[1]:
+        writes.reverse()
+    for name, value in writes:
+        if await _sudo("tee", f"{HCI_DEBUGFS}/{name}", data=f"{value}\n".encode()) is None:
+            return False
+    return True
+
+async def tune_connection_interval(min_interval=CONN_MIN_INTERVAL, max_interval=CONN_MAX_INTERVAL):
+    """
+    Ask the kernel for a short connection interval on new LE connections.
+
+    This changes adapter-wide defaults, so it is opt-in (BLE_TUNE_INTERVAL=1)
+    and the caller must hand the returned values to
+    restore_connection_interval() afterwards. Must run before connecting.
+    Needs root (via passwordless sudo) and debugfs; returns None and
+    changes nothing if the current values cannot be read.
+    """
+    saved = await _read_intervals()
+    if saved is None:
+        print("Connection interval not tuned")
+        return None
+    await _write_intervals(saved, (min_interval, max_interval))
+    return saved
+
+async def restore_connection_interval(saved):
+    """Put back the defaults returned by tune_connection_interval()"""
+    current = await _read_intervals()
+    if current is not None and current != saved:
+        await _write_intervals(current, saved)
+
+async def acquire_mtu(client):
+    """Negotiate a larger ATT MTU right after connecting (BlueZ only)"""
+    try:
+        await client._backend._acquire_mtu()
+    except (AttributeError, NotImplementedError):
+        pass  # Other backends negotiate MTU on their own
+    except Exception as e:
+        print(f"MTU exchange failed: {e}")
+    print(f"MTU: {client.mtu_size}")
+
+def _is_board(device, adv_data):
+    return device.name is not None and device.name.startswith(BOARD_NAME_PREFIX)
+
+def _passive_scan_kwargs():
+    """BleakScanner kwargs for a passive (listen-only) scan on this platform"""
+    kwargs = {"scanning_mode": "passive"}
+    if OrPattern is not None:
+        prefix = BOARD_NAME_PREFIX.encode()
+        kwargs["bluez"] = {"or_patterns": [
+            OrPattern(0, AdvertisementDataType.COMPLETE_LOCAL_NAME, prefix),
+            OrPattern(0, AdvertisementDataType.SHORTENED_LOCAL_NAME, prefix),
+        ]}
+    return kwargs
+
+async def find_board(timeout=10.0):
+    """Scan for the first DART TARGETS board; returns None if none shows up"""
+    print("Scanning...")
+    # One budget for both attempts: half for the passive scan, the rest
+    # (more if the passive one ends early) for the active fallback
+    deadline = time.monotonic() + timeout
+    
+    # Passive scanning sends no scan requests, so it adds no radio traffic
+    # next to the board's own advertising. Returns on the first match.
+    try:
+        board = await BleakScanner.find_device_by_filter(
+            _is_board, timeout=timeout / 2, **_passive_scan_kwargs()
+        )
+    except (BleakError, NotImplementedError) as e:
+        # Backend or adapter without passive scan support
+        print(f"Passive scan unavailable ({e}), scanning actively")
+        board = None
+    else:
+        if board is None:
+            # Passive scans get no scan responses, so a board that only
+            # carries its name in SCAN_RSP is invisible to them
+            print("Not found passively, scanning actively")
+    
+    if board is None:
+        remaining = deadline - time.monotonic()
+        if remaining > 0:
+            board = await BleakScanner.find_device_by_filter(_is_board, timeout=remaining)
+    
+    if not board:
+        print("Board not found!")
+        return None
+    
+    print(f"Found: {board.name}")
+    return board
+
+@asynccontextmanager
+async def connect(board, tune_interval=TUNE_INTERVAL):
+    """
+    Connect to a board with a larger MTU and, if tune_interval is set, a
+    short connection interval that is restored after disconnecting.
+
+    BleakClient's context manager disconnects on every exit path,
+    including Ctrl-C, so BlueZ is not left holding a stale connection.
+    """
+    print(f"Connecting to {board.address}...")
+    saved = await tune_connection_interval() if tune_interval else None
+    
+    try:
+        async with BleakClient(board.address) as client:
+            print("Connected!")
+            await acquire_mtu(client)
+            yield client
+        print("\nDisconnected")
+    finally:
+        if saved is not None:
+            await restore_connection_interval(saved)
+
+def missing_characteristics(client, *uuids):
+    """
+    Return the UUIDs not present in the client's GATT database.
+
+    bleak resolves services during connect(), so this needs no extra wait.
+    """
+    services = client.services
+    return [uuid for uuid in uuids if services.get_characteristic(uuid) is None]
+
+def run_main(main):
+    """Run a script's main() coroutine, on uvloop when it is installed"""
+    if uvloop is not None:
+        return uvloop.run(main())
+    return asyncio.run(main())
+
+def decode_text(data):
+    """Notification payload as text; undecodable bytes become U+FFFD"""
+    return data.decode('utf-8', errors='replace').strip()
+
+class RxPrinter:
+    """
+    Prints notifications from a background task.
+
+    Notify callbacks only enqueue, so a slow terminal never holds up
+    BlueZ's notification dispatch. If the queue fills, the oldest entry
+    is dropped. Decoded messages are also kept in `messages`. Lines go to
+    `out`, which defaults to print.
+    """
+    def __init__(self, label, decode=decode_text, maxsize=1024, out=print):
+        self.label = label
+        self.decode = decode
+        self.out = out
+        self.messages = []
+        self.last_rx = time.monotonic()  # Time of the latest notification
+        self._queue = asyncio.Queue(maxsize)
+        self._task = asyncio.create_task(self._drain())
+
+    def put(self, data):
+        """Queue a notification payload; safe to call from a notify handler"""
+        self.last_rx = time.monotonic()
+        try:
+            self._queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self._queue.put_nowait(data)
+
+    async def _drain(self):
+        while True:
+            data = await self._queue.get()
+            msg = self.decode(data)
+            self.messages.append(msg)
+            self.out(f"{self.label} {msg}")
+            self._queue.task_done()
+
+    async def close(self):
+        """Print everything still queued, then stop the drain task"""
+        await self._queue.join()
+        self._task.cancel()
+
+async def wait_until_idle(*printers, idle=0.5, timeout=5.0):
+    """
+    Wait for late notifications: return once none has arrived on any of
+    the printers for `idle` seconds, or after `timeout` at most.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        now = time.monotonic()
+        quiet = now - max(p.last_rx for p in printers)
+        if quiet >= idle or now >= deadline:
+            return
+        await asyncio.sleep(min(idle - quiet, deadline - now))
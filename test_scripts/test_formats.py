@@ -2,45 +2,48 @@
 # Test different command formats
 
 import asyncio
-from bleak import BleakClient, BleakScanner
+import sys
+from bleak.uuids import normalize_uuid_str
+from ble_common import find_board, connect, missing_characteristics, run_main, RxPrinter, wait_until_idle
 
-CMD_CHAR_UUID = "6e400002-b5a3-f393-e0a9-e50e24dcca9e"
-EVT_CHAR_UUID = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"
+CMD_CHAR_UUID = normalize_uuid_str("6e400002-b5a3-f393-e0a9-e50e24dcca9e")
+EVT_CHAR_UUID = normalize_uuid_str("6e400003-b5a3-f393-e0a9-e50e24dcca9e")
 
-async def main():
-    print("Scanning...")
-    devices = await BleakScanner.discover()
-    
-    board = None
-    for d in devices:
-        if d.name and d.name.startswith("DART TARGETS"):
-            board = d
-            break
-    
-    if not board:
-        print("Board not found!")
+# (description, payload) pairs to try, in order
+TEST_CASES = (
+    ("firm? with \\n", b"firm?\n"),
+    ("firm? with \\r\\n", b"firm?\r\n"),
+    ("firm? no ending", b"firm?"),
+    ("firm without ?", b"firm\n"),
+    ("odo? with \\n", b"odo?\n"),
+    ("odo? no ending", b"odo?"),
+    ("ODO? uppercase", b"ODO?\n"),
+    ("heart? with \\n", b"heart?\n"),
+)
+PRINT_FMTS = tuple(f"Testing: {d} -> {b}" for d, b in TEST_CASES)
+
+async def run(client):
+    """Try each command format over an already connected client"""
+    # Services are already resolved by connect()
+    missing = missing_characteristics(client, CMD_CHAR_UUID, EVT_CHAR_UUID)
+    if missing:
+        print(f"Missing characteristics: {missing}")
         return
     
-    print(f"Found: {board.name}")
-    print(f"Connecting to {board.address}...")
-    
-    client = BleakClient(board.address)
-    await client.connect()
-    print("Connected!")
+    # Resolve the write characteristic once instead of per write
+    # (written without response - replies arrive as notifications anyway)
+    cmd_char = client.services.get_characteristic(CMD_CHAR_UUID)
     
-    # Wait for services
-    await asyncio.sleep(2)
+    # Progress and RX lines are buffered in order and written out once the
+    # sends are done, so terminal I/O stays off the timed write loop
+    log = []
     
-    # Set up notification handler
-    notifications = []
+    # Set up notification handler; printing happens off the callback
+    rx = RxPrinter("✓ [RX]", out=log.append)
+    reply = asyncio.Event()  # Set by each notification to end the current wait
     def notify_handler(sender, data):
-        try:
-            msg = data.decode('utf-8').strip()
-            print(f"✓ [RX] {msg}")
-            notifications.append(msg)
-        except:
-            print(f"✓ [RX] Binary: {data.hex()}")
-            notifications.append(data.hex())
+        rx.put(data)
+        reply.set()
     
     # Subscribe to notifications
     await client.start_notify(EVT_CHAR_UUID, notify_handler)
@@ -49,24 +52,23 @@ async def main():
     await asyncio.sleep(1)
     
     # Test different formats
-    test_cases = [
-        ("firm? with \\n", b"firm?\n"),
-        ("firm? with \\r\\n", b"firm?\r\n"),
-        ("firm? no ending", b"firm?"),
-        ("firm without ?", b"firm\n"),
-        ("odo? with \\n", b"odo?\n"),
-        ("odo? no ending", b"odo?"),
-        ("ODO? uppercase", b"ODO?\n"),
-        ("heart? with \\n", b"heart?\n"),
-    ]
-    
-    for description, cmd_bytes in test_cases:
-        print(f"Testing: {description} -> {cmd_bytes}")
+    for label, (_, cmd_bytes) in zip(PRINT_FMTS, TEST_CASES):
+        log.append(label)
         try:
-            await client.write_gatt_char(CMD_CHAR_UUID, cmd_bytes)
-            await asyncio.sleep(1.5)
+            reply.clear()
+            await client.write_gatt_char(cmd_char, cmd_bytes, response=False)
+            await asyncio.wait_for(reply.wait(), timeout=1.5)
+        except asyncio.TimeoutError:
+            pass  # No reply to this format - the summary reports it
         except Exception as e:
-            print(f"  ERROR: {e}")
+            log.append(f"  ERROR: {e}")
+    
+    # The last format only waited 1.5 s for its reply
+    await wait_until_idle(rx, timeout=3.0)
+    await client.stop_notify(EVT_CHAR_UUID)
+    await rx.close()
+    sys.stdout.write("\n".join(log) + "\n")
+    notifications = rx.messages
     
     print(f"\n{'='*60}")
     print(f"Summary: Received {len(notifications)} notification(s)")
@@ -83,10 +85,14 @@ async def main():
         print("  2. Board may be in a different mode or needs reset")
         print("  3. Board may need a specific initialization sequence")
         print("  4. Try resetting the board and running this test again")
+
+async def main():
+    board = await find_board()
+    if not board:
+        return
     
-    # Disconnect properly
-    await client.disconnect()
-    print("\nDisconnected")
+    async with connect(board) as client:
+        await run(client)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_main(main)
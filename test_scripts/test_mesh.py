@@ -2,62 +2,53 @@
 # Test with Mesh Proxy characteristic
 
 import asyncio
-from bleak import BleakClient, BleakScanner
+from bleak.uuids import normalize_uuid_str
+from ble_common import find_board, connect, missing_characteristics, run_main, RxPrinter, wait_until_idle
 
 # Nordic UART Service
-CMD_CHAR_UUID = "6e400002-b5a3-f393-e0a9-e50e24dcca9e"  # UART RX (write)
-EVT_CHAR_UUID = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"  # UART TX (notify)
+CMD_CHAR_UUID = normalize_uuid_str("6e400002-b5a3-f393-e0a9-e50e24dcca9e")  # UART RX (write)
+EVT_CHAR_UUID = normalize_uuid_str("6e400003-b5a3-f393-e0a9-e50e24dcca9e")  # UART TX (notify)
 
 # Mesh Proxy Service
-MESH_DATA_IN_UUID = "00002add-0000-1000-8000-00805f9b34fb"   # Mesh Proxy Data In (write)
-MESH_DATA_OUT_UUID = "00002ade-0000-1000-8000-00805f9b34fb"  # Mesh Proxy Data Out (notify)
+MESH_DATA_IN_UUID = normalize_uuid_str("00002add-0000-1000-8000-00805f9b34fb")   # Mesh Proxy Data In (write)
+MESH_DATA_OUT_UUID = normalize_uuid_str("00002ade-0000-1000-8000-00805f9b34fb")  # Mesh Proxy Data Out (notify)
 
-async def main():
-    print("Scanning...")
-    devices = await BleakScanner.discover()
-    
-    board = None
-    for d in devices:
-        if d.name and d.name.startswith("DART TARGETS"):
-            board = d
-            break
-    
-    if not board:
-        print("Board not found!")
+# (command, newline-terminated payload) pairs - encoded once at import
+COMMANDS = tuple((cmd, f"{cmd}\n".encode()) for cmd in ("firm?", "odo?", "heart?"))
+
+async def run(client):
+    """Send UART commands while listening on UART and Mesh Proxy"""
+    # Services are already resolved by connect()
+    missing = missing_characteristics(client, CMD_CHAR_UUID, EVT_CHAR_UUID, MESH_DATA_OUT_UUID)
+    if missing:
+        print(f"Missing characteristics: {missing}")
         return
     
-    print(f"Found: {board.name}")
-    print(f"Connecting to {board.address}...")
-    
-    client = BleakClient(board.address)
-    await client.connect()
-    print("Connected!")
+    # Resolve the write characteristic once instead of per write
+    # (written without response - replies arrive as notifications anyway)
+    cmd_char = client.services.get_characteristic(CMD_CHAR_UUID)
     
-    # Wait for services
-    await asyncio.sleep(2)
-    
-    # Set up notification handlers
+    # Set up notification handlers; a reply on either path wakes the command loop
+    # Printing happens off the callbacks
+    uart_rx = RxPrinter("[UART RX]")
+    # Proxy PDUs are binary mesh packets - show them as hex
+    mesh_rx = RxPrinter("✓✓✓ [MESH RX]", decode=lambda data: data.hex())
+    reply = asyncio.Event()
     def uart_notify_handler(sender, data):
-        try:
-            msg = data.decode('utf-8').strip()
-            print(f"[UART RX] {msg}")
-        except:
-            print(f"[UART RX] Binary: {data.hex()}")
+        uart_rx.put(data)
+        reply.set()
     
     def mesh_notify_handler(sender, data):
-        try:
-            msg = data.decode('utf-8').strip()
-            print(f"✓✓✓ [MESH RX] {msg}")
-        except:
-            print(f"✓✓✓ [MESH RX] Binary: {data.hex()}")
+        mesh_rx.put(data)
+        reply.set()
     
-    # Subscribe to BOTH characteristics
-    print("\nSubscribing to UART TX notifications...")
-    await client.start_notify(EVT_CHAR_UUID, uart_notify_handler)
+    # Subscribe to BOTH characteristics - the two CCCD writes run concurrently
+    print("\nSubscribing to UART TX and MESH PROXY DATA OUT notifications...")
+    await asyncio.gather(
+        client.start_notify(EVT_CHAR_UUID, uart_notify_handler),
+        client.start_notify(MESH_DATA_OUT_UUID, mesh_notify_handler)
+    )
     print("✓ Subscribed to UART TX")
-    
-    print("\nSubscribing to MESH PROXY DATA OUT notifications...")
-    await client.start_notify(MESH_DATA_OUT_UUID, mesh_notify_handler)
     print("✓ Subscribed to MESH PROXY DATA OUT")
     
     await asyncio.sleep(1)
@@ -67,21 +58,33 @@ async def main():
     print("Sending commands via UART RX...")
     print("="*60)
     
-    commands = ["firm?", "odo?", "heart?"]
-    
-    for cmd in commands:
+    for cmd, payload in COMMANDS:
         print(f"\n[UART TX] {cmd}")
-        await client.write_gatt_char(CMD_CHAR_UUID, (cmd + "\n").encode())
-        await asyncio.sleep(2)
+        reply.clear()
+        await client.write_gatt_char(cmd_char, payload, response=False)
+        try:
+            await asyncio.wait_for(reply.wait(), timeout=2.0)
+        except asyncio.TimeoutError:
+            print("  (no response)")
     
     print("\n" + "="*60)
-    print("Waiting 5 more seconds for any responses...")
+    print("Waiting up to 5 more seconds for any responses...")
     print("="*60)
-    await asyncio.sleep(5)
+    await wait_until_idle(uart_rx, mesh_rx, timeout=5.0)
+    await asyncio.gather(
+        client.stop_notify(EVT_CHAR_UUID),
+        client.stop_notify(MESH_DATA_OUT_UUID)
+    )
+    await uart_rx.close()
+    await mesh_rx.close()
+
+async def main():
+    board = await find_board()
+    if not board:
+        return
     
-    # Disconnect
-    await client.disconnect()
-    print("\nDisconnected")
+    async with connect(board) as client:
+        await run(client)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_main(main)
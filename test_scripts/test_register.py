@@ -2,43 +2,54 @@
 # Test mesh registration
 
 import asyncio
-from bleak import BleakClient, BleakScanner
+from bleak.uuids import normalize_uuid_str
+from ble_common import find_board, connect, missing_characteristics, run_main, RxPrinter, wait_until_idle
 
-CMD_CHAR_UUID = "6e400002-b5a3-f393-e0a9-e50e24dcca9e"
-EVT_CHAR_UUID = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"
+CMD_CHAR_UUID = normalize_uuid_str("6e400002-b5a3-f393-e0a9-e50e24dcca9e")
+EVT_CHAR_UUID = normalize_uuid_str("6e400003-b5a3-f393-e0a9-e50e24dcca9e")
 MESH_ANDROID_APP_ADDR = 0x0001
 
-async def main():
-    print("Scanning...")
-    devices = await BleakScanner.discover()
-    
-    board = None
-    for d in devices:
-        if d.name and d.name.startswith("DART TARGETS"):
-            board = d
-            break
-    
-    if not board:
-        print("Board not found!")
+REGISTER_FORMATS = (
+    f"REGISTER:{MESH_ANDROID_APP_ADDR:#06x}\n",  # Current format: REGISTER:0x0001
+    f"REGISTER {MESH_ANDROID_APP_ADDR:#06x}\n",  # With space
+    f"REGISTER:{MESH_ANDROID_APP_ADDR:04x}\n",   # Lowercase hex: REGISTER:0001
+    f"REGISTER {MESH_ANDROID_APP_ADDR:04x}\n",   # Space + lowercase
+    f"REG:{MESH_ANDROID_APP_ADDR:#06x}\n",       # Short version
+    f"register:{MESH_ANDROID_APP_ADDR:#06x}\n",  # Lowercase
+)
+# (format, encoded payload) pairs - encoded once at import
+REGISTER_PAYLOADS = tuple((f, f.encode()) for f in REGISTER_FORMATS)
+PROBE_PAYLOAD = b"odo?\n"
+
+async def run(client):
+    """Try the REGISTER formats over an already connected client"""
+    # Services are already resolved by connect()
+    missing = missing_characteristics(client, CMD_CHAR_UUID, EVT_CHAR_UUID)
+    if missing:
+        print(f"Missing characteristics: {missing}")
         return
     
-    print(f"Found: {board.name}")
-    print(f"Connecting to {board.address}...")
-    
-    client = BleakClient(board.address)
-    await client.connect()
-    print("Connected!")
-    
-    # Wait for services
-    await asyncio.sleep(2)
+    # Resolve the write characteristic once instead of per write
+    # (written without response - replies arrive as notifications anyway)
+    cmd_char = client.services.get_characteristic(CMD_CHAR_UUID)
     
-    # Set up notification handler
+    # Set up notification handler; each reply wakes the command loop
+    rx = RxPrinter("✓ [NOTIFICATION]")  # Prints off the callback
+    reply = asyncio.Event()
     def notify_handler(sender, data):
+        rx.put(data)
+        reply.set()
+    
+    async def send(payload: bytes, timeout: float = 2.0) -> bool:
+        """Write a command and wait for a reply; returns whether one arrived"""
+        reply.clear()
+        await client.write_gatt_char(cmd_char, payload, response=False)
         try:
-            msg = data.decode('utf-8').strip()
-            print(f"✓ [NOTIFICATION] {msg}")
-        except:
-            print(f"✓ [NOTIFICATION] Binary: {data.hex()}")
+            await asyncio.wait_for(reply.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            print("  (no response)")
+            return False
     
     # Subscribe to notifications
     await client.start_notify(EVT_CHAR_UUID, notify_handler)
@@ -47,32 +58,32 @@ async def main():
     await asyncio.sleep(1)
     
     # Try different REGISTER formats
-    register_formats = [
-        f"REGISTER:{MESH_ANDROID_APP_ADDR:#06x}\n",  # Current format: REGISTER:0x0001
-        f"REGISTER {MESH_ANDROID_APP_ADDR:#06x}\n",  # With space
-        f"REGISTER:{MESH_ANDROID_APP_ADDR:04x}\n",   # Lowercase hex: REGISTER:0001
-        f"REGISTER {MESH_ANDROID_APP_ADDR:04x}\n",   # Space + lowercase
-        f"REG:{MESH_ANDROID_APP_ADDR:#06x}\n",       # Short version
-        f"register:{MESH_ANDROID_APP_ADDR:#06x}\n",  # Lowercase
-    ]
-    
-    for reg_cmd in register_formats:
+    for reg_cmd, payload in REGISTER_PAYLOADS:
         print(f"Trying: {repr(reg_cmd)}")
-        await client.write_gatt_char(CMD_CHAR_UUID, reg_cmd.encode())
-        await asyncio.sleep(2)
+        answered = await send(payload)
         
         # After each register attempt, try sending a command
         print("  → Sending 'odo?' to test...")
-        await client.write_gatt_char(CMD_CHAR_UUID, b"odo?\n")
-        await asyncio.sleep(2)
+        answered = await send(PROBE_PAYLOAD) or answered
         print()
+        
+        # A reply to either means this format got through - stop here
+        if answered:
+            print(f"Board responded after {repr(reg_cmd)}")
+            break
     
-    print("Test complete. Waiting 3 seconds for any delayed responses...")
-    await asyncio.sleep(3)
+    print("Test complete. Waiting up to 3 seconds for any delayed responses...")
+    await wait_until_idle(rx, timeout=3.0)
+    await client.stop_notify(EVT_CHAR_UUID)
+    await rx.close()
+
+async def main():
+    board = await find_board()
+    if not board:
+        return
     
-    # Disconnect
-    await client.disconnect()
-    print("Disconnected")
+    async with connect(board) as client:
+        await run(client)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_main(main)
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# Run every test script over a single connection
+
+from ble_common import find_board, connect, run_main
+
+import test_simple
+import test_formats
+import test_register
+import test_mesh
+
+# test_register may leave the board registered, so it runs after the
+# plain UART tests
+TESTS = (test_simple, test_formats, test_register, test_mesh)
+
+async def main():
+    board = await find_board()
+    if not board:
+        return
+    
+    async with connect(board) as client:
+        for test in TESTS:
+            print(f"\n{'#'*60}")
+            print(f"# {test.__name__}")
+            print(f"{'#'*60}")
+            await test.run(client)
+
+if __name__ == "__main__":
+    run_main(main)
@@ -2,59 +2,63 @@
 # Simple test without REGISTER command
 
 import asyncio
-from bleak import BleakClient, BleakScanner
+from bleak.uuids import normalize_uuid_str
+from ble_common import find_board, connect, missing_characteristics, run_main, RxPrinter, wait_until_idle
 
-CMD_CHAR_UUID = "6e400002-b5a3-f393-e0a9-e50e24dcca9e"
-EVT_CHAR_UUID = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"
+CMD_CHAR_UUID = normalize_uuid_str("6e400002-b5a3-f393-e0a9-e50e24dcca9e")
+EVT_CHAR_UUID = normalize_uuid_str("6e400003-b5a3-f393-e0a9-e50e24dcca9e")
 
-async def main():
-    print("Scanning...")
-    devices = await BleakScanner.discover()
+# (command, newline-terminated payload) pairs - encoded once at import
+COMMANDS = tuple((cmd, f"{cmd}\n".encode()) for cmd in ("firm?", "odo?", "heart?", "blink?"))
+
+async def run(client):
+    """Send plain UART commands over an already connected client"""
+    # Services are already resolved by connect()
+    missing = missing_characteristics(client, CMD_CHAR_UUID, EVT_CHAR_UUID)
+    if missing:
+        print(f"Missing characteristics: {missing}")
+        return
+    
+    # Resolve the write characteristic once instead of per write
+    # (written without response - replies arrive as notifications anyway)
+    cmd_char = client.services.get_characteristic(CMD_CHAR_UUID)
+    
+    # Set up notification handler; each reply wakes the command loop
+    rx = RxPrinter("[RX]")  # Prints off the callback
+    reply = asyncio.Event()
+    def notify_handler(sender, data):
+        rx.put(data)
+        reply.set()
     
-    board = None
-    for d in devices:
-        if d.name and d.name.startswith("DART TARGETS"):
-            board = d
-            break
+    # Subscribe to notifications
+    await client.start_notify(EVT_CHAR_UUID, notify_handler)
+    print("Subscribed to notifications")
     
+    # Wait a bit
+    await asyncio.sleep(1)
+    
+    # Try commands WITHOUT the REGISTER step
+    for cmd, payload in COMMANDS:
+        print(f"\n[TX] {cmd}")
+        reply.clear()
+        await client.write_gatt_char(cmd_char, payload, response=False)
+        try:
+            await asyncio.wait_for(reply.wait(), timeout=2.0)  # Wait for response
+        except asyncio.TimeoutError:
+            print("  (no response)")
+    
+    print("\nTest complete. Waiting up to 3 more seconds...")
+    await wait_until_idle(rx, timeout=3.0)
+    await client.stop_notify(EVT_CHAR_UUID)
+    await rx.close()
+
+async def main():
+    board = await find_board()
     if not board:
-        print("Board not found!")
         return
     
-    print(f"Found: {board.name}")
-    print(f"Connecting to {board.address}...")
-    
-    async with BleakClient(board.address) as client:
-        print("Connected!")
-        
-        # Wait for services
-        await asyncio.sleep(2)
-        
-        # Set up notification handler
-        def notify_handler(sender, data):
-            try:
-                msg = data.decode('utf-8').strip()
-                print(f"[RX] {msg}")
-            except:
-                print(f"[RX] Binary: {data.hex()}")
-        
-        # Subscribe to notifications
-        await client.start_notify(EVT_CHAR_UUID, notify_handler)
-        print("Subscribed to notifications")
-        
-        # Wait a bit
-        await asyncio.sleep(1)
-        
-        # Try commands WITHOUT the REGISTER step
-        commands = ["firm?", "odo?", "heart?", "blink?"]
-        
-        for cmd in commands:
-            print(f"\n[TX] {cmd}")
-            await client.write_gatt_char(CMD_CHAR_UUID, (cmd + "\n").encode())
-            await asyncio.sleep(2)  # Wait for response
-        
-        print("\nTest complete. Waiting 3 more seconds...")
-        await asyncio.sleep(3)
+    async with connect(board) as client:
+        await run(client)
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_main(main)